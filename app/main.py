@@ -1,11 +1,16 @@
 import os
+import re
 import uuid
+import asyncio
+import hashlib
+import aiofiles
+import orjson
 from fastapi import (
-    FastAPI, File, UploadFile, HTTPException, Path, Form
+    FastAPI, File, UploadFile, HTTPException, Path, Form, Header
 )
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 import uvicorn
-from typing import Dict, Union, List
+from typing import Optional, Union, List
 
 # --- Impor Model ---
 from app.models import (
@@ -19,7 +24,12 @@ from app.models import (
 )
 
 # --- Impor Celery ---
-from app.worker import celery_app, evaluate_candidate_task
+from app.worker import (
+    celery_app, 
+    evaluate_candidate_task,
+    make_evaluation_cache_key,
+    find_cached_evaluation
+)
 from celery.result import AsyncResult # Untuk cek status
 
 # --- Impor Servis Bonus ---
@@ -39,8 +49,59 @@ app = FastAPI(
 UPLOADS_DIR = "uploads"
 os.makedirs(UPLOADS_DIR, exist_ok=True)
 
-# Database in-memory Hanya untuk melacak file.
-file_database: Dict[str, Dict] = {}
+# Ukuran chunk saat streaming upload ke disk (1 MiB)
+UPLOAD_CHUNK_SIZE = 1 << 20
+
+# Interval cek status job di Redis untuk stream SSE, dan jeda keep-alive (detik)
+SSE_CHECK_INTERVAL_SECONDS = 1.0
+SSE_KEEPALIVE_SECONDS = 15.0
+# Batas umur satu stream SSE. Celery melaporkan 'PENDING' untuk ID yang tidak
+# dikenal, jadi tanpa batas ini stream untuk ID palsu tidak pernah selesai.
+SSE_MAX_STREAM_SECONDS = 600.0
+
+# Panjang ID file (prefix hex dari SHA-256 isi file)
+FILE_ID_LENGTH = 16
+FILE_ID_PATTERN = re.compile(rf"^[0-9a-f]{{{FILE_ID_LENGTH}}}$")
+
+# --- Helper ---
+
+async def save_upload_file(upload: UploadFile, destination: str) -> str:
+    """
+    Menyimpan UploadFile ke disk secara bertahap (per chunk),
+    sehingga file tidak pernah dibaca utuh ke memori.
+    Mengembalikan SHA-256 (hex) dari isi file yang dihitung saat streaming.
+    """
+    digest = hashlib.sha256()
+    async with aiofiles.open(destination, "wb") as f:
+        while chunk := await upload.read(UPLOAD_CHUNK_SIZE):
+            digest.update(chunk)
+            await f.write(chunk)
+    return digest.hexdigest()
+
+async def store_upload_by_hash(upload: UploadFile, kind: str) -> str:
+    """
+    Menyimpan upload dengan nama berbasis hash isi file ('{id}_{kind}.pdf').
+    ID bisa di-resolve oleh worker mana pun tanpa state in-memory.
+    """
+    temp_filepath = os.path.join(UPLOADS_DIR, f"{uuid.uuid4()}.part")
+    try:
+        file_id = (await save_upload_file(upload, temp_filepath))[:FILE_ID_LENGTH]
+        os.replace(temp_filepath, get_upload_path(file_id, kind))
+        return file_id
+    finally:
+        if os.path.exists(temp_filepath):
+            os.remove(temp_filepath)
+
+def get_upload_path(file_id: str, kind: str) -> str:
+    """Path file upload untuk ID dan jenis ('cv' / 'project') tertentu."""
+    return os.path.join(UPLOADS_DIR, f"{file_id}_{kind}.pdf")
+
+def resolve_upload_path(file_id: str, kind: str) -> Optional[str]:
+    """Mengembalikan path file upload jika ID valid dan file-nya ada."""
+    if not FILE_ID_PATTERN.match(file_id):
+        return None
+    path = get_upload_path(file_id, kind)
+    return path if os.path.isfile(path) else None
 
 # --- API Endpoints ---
 
@@ -66,18 +127,8 @@ async def upload_files(
     if cv.content_type != "application/pdf" or project_report.content_type != "application/pdf":
         raise HTTPException(status_code=400, detail="Invalid file type. Only PDF is allowed.")
     try:
-        cv_id = str(uuid.uuid4())
-        project_id = str(uuid.uuid4())
-        cv_filepath = os.path.join(UPLOADS_DIR, f"{cv_id}_cv.pdf")
-        project_filepath = os.path.join(UPLOADS_DIR, f"{project_id}_project.pdf")
-
-        with open(cv_filepath, "wb") as buffer:
-            buffer.write(await cv.read())
-        with open(project_filepath, "wb") as buffer:
-            buffer.write(await project_report.read())
-
-        file_database[cv_id] = {"filename": f"{cv_id}_cv.pdf", "path": cv_filepath}
-        file_database[project_id] = {"filename": f"{project_id}_project.pdf", "path": project_filepath}
+        cv_id = await store_upload_by_hash(cv, "cv")
+        project_id = await store_upload_by_hash(project_report, "project")
 
         return JSONResponse(status_code=201, content={
             "message": "Files uploaded successfully",
@@ -99,20 +150,29 @@ async def evaluate_candidate(
     Memicu pipeline evaluasi AI secara asynchronous via Celery.
     Segera mengembalikan Task ID Celery sebagai `job_id`.
     """
-    if request.cv_id not in file_database:
+    cv_path = resolve_upload_path(request.cv_id, "cv")
+    if cv_path is None:
         raise HTTPException(status_code=404, detail=f"CV with ID {request.cv_id} not found.")
-    if request.project_report_id not in file_database:
+    report_path = resolve_upload_path(request.project_report_id, "project")
+    if report_path is None:
         raise HTTPException(status_code=404, detail=f"Project Report with ID {request.project_report_id} not found.")
 
-    cv_path = file_database[request.cv_id]['path']
-    report_path = file_database[request.project_report_id]['path']
+    # Input identik sudah pernah dievaluasi? Kembalikan job yang lama.
+    cache_key = make_evaluation_cache_key(
+        request.cv_id, request.project_report_id, request.job_title
+    )
+    cached_task_id = await asyncio.to_thread(find_cached_evaluation, cache_key)
+    if cached_task_id:
+        print(f"Hasil evaluasi identik ditemukan di cache: task {cached_task_id}.")
+        return JobStatusQueued(id=cached_task_id, status="queued")
 
     # Panggil Celery task dengan .delay()
     print(f"Mendaftarkan task ke Celery...")
     task = evaluate_candidate_task.delay( #type: ignore
         cv_path, 
         report_path, 
-        request.job_title
+        request.job_title,
+        cache_key
     )
     
     # kembalikan ID dari Celery.
@@ -134,14 +194,79 @@ async def get_evaluation_result(
     """
     Mengambil status dan hasil dari job evaluasi berdasarkan ID Task Celery.
     """
-    # Cek status task di backend Celery (Redis)
     print(f"Mengecek status untuk task_id: {id}")
+    return await get_job_status(id)
+
+
+@app.get("/result/{id}/stream", 
+         tags=["3. Result"],
+         summary="Stream status evaluasi via Server-Sent Events")
+async def stream_evaluation_result(
+    id: str = Path(..., description="ID job yang didapat dari /evaluate", example="a8a3...")
+):
+    """
+    Mengirim status job sebagai Server-Sent Events setiap kali status berubah
+    (skema sama dengan GET /result/{id}), lalu menutup stream saat job
+    'completed' atau 'failed'. Menggantikan polling dari sisi klien.
+    Stream ditutup dengan event 'timeout' setelah SSE_MAX_STREAM_SECONDS;
+    klien bisa membuka ulang stream atau beralih ke GET /result/{id}.
+    """
+    # ID task Celery selalu UUID; ID lain pasti tidak dikenal
+    try:
+        uuid.UUID(id)
+    except ValueError:
+        raise HTTPException(status_code=404, detail=f"Job with ID {id} not found.")
+    print(f"Membuka stream status untuk task_id: {id}")
+
+    async def event_stream():
+        last_status = None
+        idle_seconds = 0.0
+        elapsed_seconds = 0.0
+        while True:
+            try:
+                job = await get_job_status(id)
+            except HTTPException as e:
+                yield f"event: error\ndata: {orjson.dumps({'detail': e.detail}).decode()}\n\n"
+                return
+
+            if job.status != last_status:
+                last_status = job.status
+                idle_seconds = 0.0
+                yield f"data: {job.model_dump_json()}\n\n"
+            elif idle_seconds >= SSE_KEEPALIVE_SECONDS:
+                # Komentar SSE agar koneksi tidak diputus proxy/klien saat idle
+                idle_seconds = 0.0
+                yield ": keep-alive\n\n"
+
+            if job.status in ("completed", "failed"):
+                return
+            if elapsed_seconds >= SSE_MAX_STREAM_SECONDS:
+                detail = f"Stream closed after {SSE_MAX_STREAM_SECONDS:.0f}s; last status '{job.status}'."
+                yield f"event: timeout\ndata: {orjson.dumps({'detail': detail}).decode()}\n\n"
+                return
+            await asyncio.sleep(SSE_CHECK_INTERVAL_SECONDS)
+            idle_seconds += SSE_CHECK_INTERVAL_SECONDS
+            elapsed_seconds += SSE_CHECK_INTERVAL_SECONDS
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache"}
+    )
+
+
+async def get_job_status(id: str) -> EvaluationResponse:
+    """Membaca status job Celery dan memetakannya ke model response API."""
+    # Cek status task di backend Celery (Redis)
     task_result = AsyncResult(id, app=celery_app)
     
-    status = task_result.status
+    # Baca status dari Redis di thread agar event loop tidak terblokir.
+    # Meta task yang sudah selesai di-cache oleh AsyncResult, sehingga
+    # '.result' / '.info' di bawah tidak memicu panggilan Redis lagi.
+    status = await asyncio.to_thread(lambda: task_result.status)
 
     if status == "SUCCESS":
-        result_data = task_result.get() 
+        result_data = task_result.result
         
         if not result_data or not isinstance(result_data, dict):
             # Error internal jika task sukses tapi tidak mengembalikan dict
@@ -175,12 +300,19 @@ async def get_evaluation_result(
          response_model=List[DocumentSummary],
          tags=["4. Bonus: Documents (RAG)"],
          summary="Melihat daftar semua Dokumen Ground Truth")
-async def get_documents():
+async def get_documents(
+    if_none_match: Optional[str] = Header(None, description="ETag dari respons sebelumnya")
+):
     """
     Mengambil daftar semua 'source' dokumen (JD, Rubrik)
     yang saat ini ada di Vector DB (Chroma).
+    Mendukung conditional request: jika daftar tidak berubah, balas 304.
     """
-    return list_ground_truth_documents()
+    body = orjson.dumps(list_ground_truth_documents())
+    etag = f'"{hashlib.sha256(body).hexdigest()[:32]}"'
+    if if_none_match == etag:
+        return Response(status_code=304, headers={"ETag": etag})
+    return Response(content=body, media_type="application/json", headers={"ETag": etag})
 
 @app.post("/documents", 
           tags=["4. Bonus: Documents (RAG)"],
@@ -196,16 +328,21 @@ async def upload_document(
     if not file.filename:
         raise HTTPException(status_code=400, detail="Nama file tidak ditemukan")
         
-    file_bytes = await file.read()
+    # Simpan sementara ke disk (streaming), lalu ingest dari path
+    temp_filepath = os.path.join(UPLOADS_DIR, f"{uuid.uuid4()}_{os.path.basename(file.filename)}")
     
     try:
-        result = ingest_document(file_bytes, file.filename, source_name)
+        await save_upload_file(file, temp_filepath)
+        result = ingest_document(temp_filepath, file.filename, source_name)
         return JSONResponse(status_code=201, content=result)
     except Exception as e:
         # Menangkap error dari service (misal: file tidak didukung)
         if isinstance(e, HTTPException):
             raise e
         raise HTTPException(status_code=500, detail=f"Gagal ingest dokumen: {str(e)}")
+    finally:
+        if os.path.exists(temp_filepath):
+            os.remove(temp_filepath)
 
 
 # Perintah untuk menjalankan server
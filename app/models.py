@@ -18,11 +18,11 @@ class EvaluateRequest(BaseModel):
     job_title: str = Field(description="Judul pekerjaan yang dilamar kandidat.", examples=["Backend Developer"])
     cv_id: str = Field(
         description="ID unik dari CV yang diupload.", 
-        examples=["a1b2c3d4-..."]
+        examples=["3f9a1c0b7d2e4a65"]
     )
     project_report_id: str = Field(
         description="ID unik dari Laporan Proyek yang diupload.", 
-        examples=["e5f6g7h8-..."]
+        examples=["8c41e07b5a9d2f13"]
     )
 
 # --- Model untuk Response Body ---
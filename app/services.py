@@ -1,19 +1,26 @@
 import os
-import re
+import asyncio
 import json
 import time
+import functools
 import sys
-from typing import Dict, List, Any, Type, TypeVar 
-from pypdf import PdfReader
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, List, Any, Optional, Tuple, Type, TypeVar 
+import pymupdf
 from dotenv import load_dotenv
 from fastapi import HTTPException
 import chromadb
 import google.generativeai as genai
 from google.generativeai.types import GenerationConfig
 from google.generativeai.generative_models import GenerativeModel
+from google.api_core import exceptions as google_exceptions
 from pydantic import BaseModel, ValidationError
-import io
-from chromadb.utils.embedding_functions import SentenceTransformerEmbeddingFunction
+from tenacity import (
+    RetryCallState, retry, retry_if_exception_type,
+    stop_after_attempt, wait_exponential, wait_random
+)
 
 # --- Konfigurasi Awal ---
 
@@ -25,9 +32,30 @@ load_dotenv()
 
 # --- Konstanta ---
 CHROMA_DB_PATH = os.path.join(project_root, "chroma_db")
+# Jika CHROMA_HOST di-set, gunakan server Chroma (HttpClient) alih-alih file lokal
+CHROMA_HOST = os.getenv("CHROMA_HOST")
+CHROMA_PORT = int(os.getenv("CHROMA_PORT", "8001"))
 COLLECTION_NAME = "screening_collection"
-EMBEDDING_MODEL_NAME = "all-MiniLM-L6-v2" 
+EMBEDDING_BATCH_SIZE = 64
 LLM_MODEL_NAME = "gemini-2.0-flash"
+LLM_TEMPERATURE = 0.2
+GEMINI_TRANSPORT = os.getenv("GEMINI_TRANSPORT", "grpc")  # "grpc" atau "rest"
+
+# Jumlah proses untuk parsing PDF (CV + Laporan Proyek)
+PDF_POOL_WORKERS = 2
+
+# Umur maksimum cache hasil RAG (detik)
+RAG_CACHE_TTL_SECONDS = 300
+
+# Kebijakan retry LLM
+LLM_MAX_ATTEMPTS = 3
+LLM_RETRY_BASE_DELAY = 2   # detik, dikali 2 setiap percobaan
+LLM_RETRY_MAX_DELAY = 30   # detik
+RETRIABLE_LLM_ERRORS = (
+    google_exceptions.ResourceExhausted,
+    google_exceptions.ServiceUnavailable,
+    google_exceptions.DeadlineExceeded,
+)
 
 # Ini akan memperbaiki semua error 'BaseModel' vs 'CvEvaluationOutput'
 T = TypeVar("T", bound=BaseModel)
@@ -45,103 +73,242 @@ class ProjectEvaluationOutput(BaseModel):
 class FinalSummaryOutput(BaseModel):
     overall_summary: str
 
+# Skema JSON statis untuk prompt, cukup di-serialisasi sekali saat import
+_CV_SCHEMA_STR = json.dumps(CvEvaluationOutput.model_json_schema(), indent=2)
+_PROJ_SCHEMA_STR = json.dumps(ProjectEvaluationOutput.model_json_schema(), indent=2)
+_SUM_SCHEMA_STR = json.dumps(FinalSummaryOutput.model_json_schema(), indent=2)
+
 # --- Klien Servis (Chroma & Gemini) ---
 
-try:
-    chroma_client = chromadb.PersistentClient(path=CHROMA_DB_PATH)
-    from chromadb.utils.embedding_functions import SentenceTransformerEmbeddingFunction
-    embedding_func = SentenceTransformerEmbeddingFunction(model_name=EMBEDDING_MODEL_NAME)
-    
-    collection = chroma_client.get_collection(
-        name=COLLECTION_NAME,
-        embedding_function=embedding_func # type: ignore
-    )
-    print(f"Koneksi ke ChromaDB collection '{COLLECTION_NAME}' berhasil.")
-except Exception as e:
-    print(f"CRITICAL: Gagal terhubung ke ChromaDB. Error: {e}")
-    collection = None 
-
-try:
-    GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
-    if not GEMINI_API_KEY:
-        raise ValueError("GEMINI_API_KEY tidak ditemukan di file .env")
-    
-    genai.configure(api_key=GEMINI_API_KEY) # type: ignore
-    
-    generation_config = GenerationConfig(
-        temperature=0.2,
-        response_mime_type="application/json"
-    )
-    llm_model = GenerativeModel(
-        model_name=LLM_MODEL_NAME,
-        generation_config=generation_config
-    )
-    print(f"Koneksi ke Gemini model '{LLM_MODEL_NAME}' berhasil.")
-except Exception as e:
-    print(f"CRITICAL: Gagal mengkonfigurasi Gemini. Error: {e}")
-    llm_model = None
+# Semua klien dibuat secara lazy (saat pertama kali dipakai) lalu di-cache per proses,
+# sehingga worker FastAPI yang hanya melayani /upload atau /result tidak ikut
+# memuat model embedding, membuka Chroma, atau mengkonfigurasi Gemini.
+# Exception tidak di-cache oleh functools.cache, jadi kegagalan akan dicoba lagi.
+
+def get_embedding_function():
+    """
+    Mengembalikan embedding function (dibuat sekali, lalu dipakai ulang).
+    Sama dengan yang dipakai scripts/ingest.py agar embedding kueri & dokumen konsisten.
+    """
+    from scripts.ingest import get_embedding_function as get_local_embedding_function
+    return get_local_embedding_function()
+
+@functools.cache
+def get_chroma_client():
+    """Mengembalikan klien ChromaDB (dibuat sekali, lalu dipakai ulang)."""
+    if CHROMA_HOST:
+        # Mode server: semua worker berbagi satu index lewat HTTP
+        return chromadb.HttpClient(host=CHROMA_HOST, port=CHROMA_PORT)
+    return chromadb.PersistentClient(path=CHROMA_DB_PATH)
+
+@functools.cache
+def get_collection():
+    """Mengembalikan Chroma collection ground truth."""
+    try:
+        coll = get_chroma_client().get_collection(
+            name=COLLECTION_NAME,
+            embedding_function=get_embedding_function() # type: ignore
+        )
+        print(f"Koneksi ke ChromaDB collection '{COLLECTION_NAME}' berhasil.")
+        return coll
+    except Exception as e:
+        print(f"CRITICAL: Gagal terhubung ke ChromaDB. Error: {e}")
+        raise
+
+@functools.cache
+def get_llm() -> GenerativeModel:
+    """Mengembalikan model Gemini yang sudah dikonfigurasi."""
+    try:
+        GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
+        if not GEMINI_API_KEY:
+            raise ValueError("GEMINI_API_KEY tidak ditemukan di file .env")
+        
+        # SDK membuat satu klien (channel gRPC HTTP/2, atau session REST) per proses
+        # dan memakainya ulang untuk semua panggilan, jadi handshake TLS hanya sekali.
+        genai.configure(api_key=GEMINI_API_KEY, transport=GEMINI_TRANSPORT) # type: ignore
+        
+        generation_config = GenerationConfig(
+            temperature=LLM_TEMPERATURE,
+            response_mime_type="application/json"
+        )
+        llm_model = GenerativeModel(
+            model_name=LLM_MODEL_NAME,
+            generation_config=generation_config
+        )
+        print(f"Koneksi ke Gemini model '{LLM_MODEL_NAME}' berhasil.")
+        return llm_model
+    except Exception as e:
+        print(f"CRITICAL: Gagal mengkonfigurasi Gemini. Error: {e}")
+        raise
 
 # --- Fungsi Helper ---
 
+def extract_pdf_text(file_path: str) -> str:
+    """
+    Menggabungkan teks semua halaman (halaman kosong dilewati) sekali jalan.
+    Menggunakan PyMuPDF (MuPDF, C) yang jauh lebih cepat dari parser pure-Python.
+    """
+    with pymupdf.open(file_path) as doc:
+        parts = [page_text for page_text in (page.get_text() for page in doc) if page_text]
+    return "\n\n".join(parts)
+
 def parse_pdf(file_path: str) -> str:
     """Membaca file PDF dan mengembalikan isinya sebagai satu string."""
     try:
-        reader = PdfReader(file_path)
-        text = ""
-        for page in reader.pages:
-            text += page.extract_text() + "\n\n"
+        text = extract_pdf_text(file_path)
         print(f"Berhasil mem-parsing {file_path}")
         return text
     except Exception as e:
         print(f"Gagal mem-parsing PDF di {file_path}: {e}")
         raise
 
-def query_rag(query_text: str, sources: List[str], n_results: int = 5) -> str:
-    """Membuat kueri ke ChromaDB untuk konteks RAG."""
-    if collection is None:
-        raise Exception("Koneksi ChromaDB tidak tersedia.")
+_PDF_POOL: Optional[ProcessPoolExecutor] = None
+# True jika process pool tidak bisa dipakai di proses ini (dicek / dicoba sekali saja)
+_PDF_POOL_DISABLED = False
+
+def _get_pdf_pool() -> Optional[ProcessPoolExecutor]:
+    """
+    Process pool untuk parsing PDF (dibuat saat pertama kali dipakai).
+    None jika proses ini tidak boleh punya proses anak, misal worker Celery
+    prefork yang daemonic, atau pool sudah pernah gagal.
+    """
+    global _PDF_POOL, _PDF_POOL_DISABLED
+    if _PDF_POOL is None and not _PDF_POOL_DISABLED:
+        if multiprocessing.current_process().daemon:
+            print("Proses daemonic, parsing PDF dijalankan di thread.")
+            _PDF_POOL_DISABLED = True
+        else:
+            _PDF_POOL = ProcessPoolExecutor(max_workers=PDF_POOL_WORKERS)
+    return _PDF_POOL
+
+def _disable_pdf_pool(error: BaseException) -> None:
+    """Mematikan process pool yang gagal agar panggilan berikutnya langsung memakai thread."""
+    global _PDF_POOL, _PDF_POOL_DISABLED
+    print(f"Process pool PDF tidak tersedia ({error}), parsing di thread.")
+    if _PDF_POOL is not None:
+        # Buang work item yang tertinggal di pool yang gagal
+        _PDF_POOL.shutdown(wait=False, cancel_futures=True)
+    _PDF_POOL = None
+    _PDF_POOL_DISABLED = True
+
+async def parse_pdfs(*file_paths: str) -> List[str]:
+    """
+    Mem-parsing beberapa PDF secara paralel di process pool (lepas dari GIL).
+    Jika proses anak tidak bisa dibuat (misal: worker Celery prefork yang daemonic),
+    parsing dijalankan di thread sebagai fallback.
+    """
+    loop = asyncio.get_running_loop()
+    pool = _get_pdf_pool()
+    if pool is not None:
+        try:
+            futures = [loop.run_in_executor(pool, parse_pdf, path) for path in file_paths]
+        except (AssertionError, BrokenProcessPool, OSError) as e:
+            _disable_pdf_pool(e)
+        else:
+            try:
+                return list(await asyncio.gather(*futures))
+            except BrokenProcessPool as e:
+                _disable_pdf_pool(e)
+    return list(await asyncio.gather(*(asyncio.to_thread(parse_pdf, path) for path in file_paths)))
+
+def query_rag_batch(queries: List[Tuple[str, List[str]]], n_results: int = 5) -> List[str]:
+    """
+    Membuat beberapa kueri RAG ke ChromaDB sekaligus.
+    Setiap item berisi (query_text, sources); hasilnya adalah konteks
+    per kueri dengan urutan yang sama seperti input.
+    Teks kueri di-embed dalam satu batch, lalu setiap kueri dicari dengan
+    filter sumbernya sendiri agar top-k per sumber tetap tepat.
+    Hasil di-cache karena dokumen ground truth jarang berubah.
+    """
+    queries_key = tuple((query_text, tuple(sorted(sources))) for query_text, sources in queries)
+    # Bucket waktu membatasi umur cache di proses lain (misal: worker Celery)
+    # yang tidak ikut ter-invalidate saat ingest_document dipanggil di API.
+    ttl_bucket = int(time.monotonic() // RAG_CACHE_TTL_SECONDS)
+    return list(_query_rag_batch_cached(queries_key, n_results, ttl_bucket))
+
+@functools.lru_cache(maxsize=256)
+def _query_rag_batch_cached(
+    queries: Tuple[Tuple[str, Tuple[str, ...]], ...], 
+    n_results: int, 
+    ttl_bucket: int
+) -> Tuple[str, ...]:
+    """Implementasi query_rag_batch yang di-cache (key harus hashable)."""
+    if not queries:
+        return ()
+    try:
+        collection = get_collection()
+    except Exception as e:
+        raise Exception(f"Koneksi ChromaDB tidak tersedia: {e}")
+    
     try:
-        results = collection.query(
-            query_texts=[query_text],
-            n_results=n_results,
-            where={"source": {"$in": sources}} # type: ignore
+        # Bagian termahal (embedding) dikerjakan sekali untuk semua kueri
+        query_embeddings = get_embedding_function().encode(
+            [query_text for query_text, _ in queries]
         )
-        
-        if not results or not isinstance(results, dict):
-            print("RAG query: results kosong atau bukan dict")
-            return ""
-
-        docs = results.get("documents")
-        if not docs or not docs[0]:
-            print("RAG query: tidak ada dokumen relevan")
-            return ""
 
-        context = "\n---\n".join(docs[0])
-        return context
+        contexts = []
+        for (query_text, sources), query_embedding in zip(queries, query_embeddings):
+            # Filter per kueri: dokumen besar dari sumber lain tidak bisa
+            # menggeser hasil sumber yang dituju
+            results = collection.query(
+                query_embeddings=[query_embedding],
+                n_results=n_results,
+                where={"source": {"$in": list(sources)}} # type: ignore
+            )
+            docs = (results.get("documents") or [[]])[0] if isinstance(results, dict) else []
+            
+            if not docs:
+                print(f"RAG query: tidak ada dokumen relevan untuk '{query_text}'")
+            contexts.append("\n---\n".join(docs))
+        return tuple(contexts)
 
     except Exception as e:
         print(f"Gagal RAG query: {e}")
         raise
 
-def call_gemini_with_retry(prompt: str, retries: int = 3, delay: int = 5) -> str:
-    """Memanggil API LLM dengan retry logic sederhana."""
-    if llm_model is None:
-        raise Exception("Model LLM (Gemini) tidak terinisialisasi.")
+def _log_llm_retry(retry_state: RetryCallState) -> None:
+    """Mencatat error sementara sebelum tenacity menunggu untuk retry."""
+    exc = retry_state.outcome.exception() if retry_state.outcome else None
+    wait = retry_state.next_action.sleep if retry_state.next_action else 0
+    print(f"Gagal memanggil LLM (sementara): {exc}. Mencoba lagi dalam {wait:.1f} detik...")
+
+@retry(
+    # Hanya error sementara (rate limit, server sibuk, timeout) yang di-retry;
+    # error lain (misal: InvalidArgument, PermissionDenied) langsung dilempar.
+    retry=retry_if_exception_type(RETRIABLE_LLM_ERRORS),
+    wait=wait_exponential(multiplier=LLM_RETRY_BASE_DELAY, max=LLM_RETRY_MAX_DELAY) + wait_random(0, 1),
+    stop=stop_after_attempt(LLM_MAX_ATTEMPTS),
+    before_sleep=_log_llm_retry,
+    reraise=True,
+)
+def call_gemini_with_retry(prompt: str, output_model: Optional[Type[BaseModel]] = None) -> str:
+    """
+    Memanggil API LLM dengan exponential backoff + jitter untuk error sementara.
+    Jika output_model diberikan, Gemini dipaksa mengikuti skema tersebut (structured output).
+    """
+    try:
+        llm_model = get_llm()
+    except Exception as e:
+        raise Exception(f"Model LLM (Gemini) tidak terinisialisasi: {e}")
     
-    for attempt in range(retries):
-        try:
-            print(f"Memanggil LLM (Attempt {attempt + 1}/{retries})...")
-            response = llm_model.generate_content(prompt)
-            return response.text
-        except Exception as e:
-            print(f"Gagal memanggil LLM: {e}")
-            if attempt < retries - 1:
-                print(f"Mencoba lagi dalam {delay} detik...")
-                time.sleep(delay)
-            else:
-                print("Gagal memanggil LLM setelah beberapa kali percobaan.")
-                raise 
-    return ""  # NOTE: Pylance mungkin masih error di sini, tapi ini unreachable.
+    print("Memanggil LLM...")
+    if output_model is None:
+        response = llm_model.generate_content(prompt)
+    else:
+        response = llm_model.generate_content(
+            prompt,
+            generation_config=_structured_generation_config(output_model)
+        )
+    return response.text
+
+@functools.lru_cache(maxsize=None)
+def _structured_generation_config(output_model: Type[BaseModel]) -> GenerationConfig:
+    """GenerationConfig dengan response_schema untuk model output tertentu."""
+    return GenerationConfig(
+        temperature=LLM_TEMPERATURE,
+        response_mime_type="application/json",
+        response_schema=output_model
+    )
 
 def parse_llm_json(
     llm_output: str, 
@@ -149,28 +316,19 @@ def parse_llm_json(
 ) -> T:
     """
     Mem-parsing output JSON dari LLM dan memvalidasinya dengan model Pydantic.
+    Parsing + validasi dilakukan sekali jalan oleh pydantic-core (tanpa dict perantara).
     """
-    json_data: Dict[str, Any] = {}
     try:
-        match = re.search(r"\{.*\}", llm_output, re.DOTALL)
-        if not match:
-            print(f"Peringatan: Output LLM bukan JSON, mencoba parsing langsung: {llm_output[:50]}...")
-            json_str = llm_output
-        else:
-            json_str = match.group(0)
-
-        json_data = json.loads(json_str)
-        
-        # Pylance sekarang tahu 'validated_data' adalah Tipe 'T' (misal: CvEvaluationOutput)
-        validated_data = output_model(**json_data)
+        # Output sudah dijamin JSON murni oleh response_schema, tanpa perlu regex
+        validated_data = output_model.model_validate_json(llm_output)
         print(f"Berhasil mem-parsing dan validasi output LLM untuk {output_model.__name__}")
         return validated_data
         
-    except json.JSONDecodeError as e:
-        print(f"FATAL: Gagal mem-parsing JSON dari LLM. Error: {e}. Output mentah: {llm_output}")
-        raise Exception(f"Invalid JSON response from LLM: {e}")
     except ValidationError as e:
-        print(f"FATAL: Output JSON LLM tidak sesuai skema. Error: {e}. Data: {json_data}")
+        if any(err["type"] == "json_invalid" for err in e.errors()):
+            print(f"FATAL: Gagal mem-parsing JSON dari LLM. Error: {e}. Output mentah: {llm_output}")
+            raise Exception(f"Invalid JSON response from LLM: {e}")
+        print(f"FATAL: Output JSON LLM tidak sesuai skema. Error: {e}. Output mentah: {llm_output}")
         raise Exception(f"LLM output schema mismatch: {e}")
     except Exception as e:
         print(f"FATAL: Error tidak diketahui saat parsing. Error: {e}")
@@ -178,11 +336,22 @@ def parse_llm_json(
 
 # --- Desain Prompt ---
 
-def create_cv_prompt(cv_text: str, jd_context: str, rubric_context: str) -> str:
-    """Membuat prompt untuk evaluasi CV"""
-    output_schema = CvEvaluationOutput.model_json_schema()
-    
+# Bagian statis prompt (termasuk skema JSON) dirender sekali saat import;
+# builder hanya menyambung potongan statis dengan konteks via "".join.
+
+def _render_output_instructions(schema_str: str) -> str:
+    """Blok instruksi output (sama untuk semua prompt) beserta skema JSON-nya."""
     return f"""
+    
+    INSTRUKSI OUTPUT:
+    Anda HARUS memberikan jawaban HANYA dalam format JSON yang valid, sesuai dengan skema ini.
+    JANGAN tambahkan salam, penjelasan, atau teks lain di luar blok JSON.
+    
+    Skema JSON:
+    {schema_str}
+    """
+
+_CV_PROMPT_HEAD = """
     Anda adalah seorang Manajer Perekrutan Teknis senior.
     Tugas Anda adalah mengevaluasi CV kandidat berdasarkan Deskripsi Pekerjaan (Job Description) dan Rubrik Penilaian CV.
     
@@ -191,28 +360,19 @@ def create_cv_prompt(cv_text: str, jd_context: str, rubric_context: str) -> str:
 
     KONTEKS PENTING:
     --- Rubrik Penilaian CV ---
-    {rubric_context}
+    """
+_CV_PROMPT_JD = """
     
     --- Deskripsi Pekerjaan (Job Description) ---
-    {jd_context}
+    """
+_CV_PROMPT_CANDIDATE = """
 
     DATA KANDIDAT:
     --- CV Kandidat (Teks) ---
-    {cv_text}
-    
-    INSTRUKSI OUTPUT:
-    Anda HARUS memberikan jawaban HANYA dalam format JSON yang valid, sesuai dengan skema ini.
-    JANGAN tambahkan salam, penjelasan, atau teks lain di luar blok JSON.
-    
-    Skema JSON:
-    {json.dumps(output_schema, indent=2)}
     """
+_CV_PROMPT_TAIL = _render_output_instructions(_CV_SCHEMA_STR)
 
-def create_project_prompt(report_text: str, brief_context: str, rubric_context: str) -> str:
-    """Membuat prompt untuk evaluasi Laporan Proyek"""
-    output_schema = ProjectEvaluationOutput.model_json_schema()
-    
-    return f"""
+_PROJ_PROMPT_HEAD = """
     Anda adalah seorang Senior Backend Engineer.
     Tugas Anda adalah mengevaluasi Laporan Proyek kandidat berdasarkan Case Study Brief (soal) dan Rubrik Penilaian Proyek.
     
@@ -221,51 +381,77 @@ def create_project_prompt(report_text: str, brief_context: str, rubric_context:
 
     KONTEKS PENTING:
     --- Rubrik Penilaian Proyek ---
-    {rubric_context}
+    """
+_PROJ_PROMPT_BRIEF = """
     
     --- Case Study Brief (Soal) ---
-    {brief_context}
+    """
+_PROJ_PROMPT_CANDIDATE = """
 
     DATA KANDIDAT:
     --- Laporan Proyek Kandidat (Teks) ---
-    {report_text}
-    
-    INSTRUKSI OUTPUT:
-    Anda HARUS memberikan jawaban HANYA dalam format JSON yang valid, sesuai dengan skema ini.
-    JANGAN tambahkan salam, penjelasan, atau teks lain di luar blok JSON.
-    
-    Skema JSON:
-    {json.dumps(output_schema, indent=2)}
     """
+_PROJ_PROMPT_TAIL = _render_output_instructions(_PROJ_SCHEMA_STR)
 
-def create_summary_prompt(cv_eval: CvEvaluationOutput, project_eval: ProjectEvaluationOutput) -> str:
-    """Membuat prompt untuk analisis akhir/ringkasan"""
-    output_schema = FinalSummaryOutput.model_json_schema()
-    
-    return f"""
+_SUM_PROMPT_HEAD = """
     Anda adalah seorang Hiring Manager.
     Anda telah menerima dua laporan evaluasi untuk seorang kandidat.
     Tugas Anda adalah mensintesis kedua evaluasi ini menjadi satu ringkasan akhir (3-5 kalimat)
     yang menyoroti kekuatan, kelemahan, dan rekomendasi.
     
     EVALUASI 1: CV
-    {cv_eval.model_dump_json(indent=2)}
+    """
+_SUM_PROMPT_PROJECT = """
     
     EVALUASI 2: Laporan Proyek
-    {project_eval.model_dump_json(indent=2)}
-    
-    INSTRUKSI OUTPUT:
-    Anda HARUS memberikan jawaban HANYA dalam format JSON yang valid, sesuai dengan skema ini.
-    JANGAN tambahkan salam, penjelasan, atau teks lain di luar blok JSON.
-    
-    Skema JSON:
-    {json.dumps(output_schema, indent=2)}
     """
+_SUM_PROMPT_TAIL = _render_output_instructions(_SUM_SCHEMA_STR)
+
+def create_cv_prompt(cv_text: str, jd_context: str, rubric_context: str) -> str:
+    """Membuat prompt untuk evaluasi CV"""
+    return "".join([
+        _CV_PROMPT_HEAD, rubric_context,
+        _CV_PROMPT_JD, jd_context,
+        _CV_PROMPT_CANDIDATE, cv_text,
+        _CV_PROMPT_TAIL,
+    ])
+
+def create_project_prompt(report_text: str, brief_context: str, rubric_context: str) -> str:
+    """Membuat prompt untuk evaluasi Laporan Proyek"""
+    return "".join([
+        _PROJ_PROMPT_HEAD, rubric_context,
+        _PROJ_PROMPT_BRIEF, brief_context,
+        _PROJ_PROMPT_CANDIDATE, report_text,
+        _PROJ_PROMPT_TAIL,
+    ])
+
+def create_summary_prompt(cv_eval: CvEvaluationOutput, project_eval: ProjectEvaluationOutput) -> str:
+    """Membuat prompt untuk analisis akhir/ringkasan"""
+    return "".join([
+        _SUM_PROMPT_HEAD, cv_eval.model_dump_json(indent=2),
+        _SUM_PROMPT_PROJECT, project_eval.model_dump_json(indent=2),
+        _SUM_PROMPT_TAIL,
+    ])
+
+
+# --- Tahap Evaluasi ---
+
+async def evaluate_cv(cv_text: str, jd_context: str, rubric_context: str) -> CvEvaluationOutput:
+    """Evaluasi CV; panggilan LLM (blocking) dijalankan di thread terpisah."""
+    cv_prompt = create_cv_prompt(cv_text, jd_context, rubric_context)
+    cv_response_str = await asyncio.to_thread(call_gemini_with_retry, cv_prompt, CvEvaluationOutput)
+    return parse_llm_json(cv_response_str, CvEvaluationOutput)
+
+async def evaluate_project(report_text: str, brief_context: str, rubric_context: str) -> ProjectEvaluationOutput:
+    """Evaluasi Laporan Proyek; panggilan LLM (blocking) dijalankan di thread terpisah."""
+    project_prompt = create_project_prompt(report_text, brief_context, rubric_context)
+    project_response_str = await asyncio.to_thread(call_gemini_with_retry, project_prompt, ProjectEvaluationOutput)
+    return parse_llm_json(project_response_str, ProjectEvaluationOutput)
 
 
 # --- FUNGSI UTAMA PIPELINE ---
 
-def run_real_evaluation_pipeline(
+async def run_real_evaluation_pipeline(
     job_id: str, 
     cv_path: str, 
     report_path: str, 
@@ -279,40 +465,27 @@ def run_real_evaluation_pipeline(
     try:
         print(f"Job {job_id} status: processing")
         
-        cv_text = parse_pdf(cv_path)
-        report_text = parse_pdf(report_path)
+        cv_text, report_text = await parse_pdfs(cv_path, report_path)
         
-        print(f"Job {job_id}: Memulai Evaluasi CV...")
-        jd_context = query_rag(
-            query_text=f"skills untuk {job_title}", 
-            sources=["job_description"]
-        )
-        cv_rubric_context = query_rag(
-            query_text="rubrik penilaian cv", 
-            sources=["cv_rubric"]
-        )
-        cv_prompt = create_cv_prompt(cv_text, jd_context, cv_rubric_context)
-        cv_response_str = call_gemini_with_retry(cv_prompt)
-        cv_eval = parse_llm_json(cv_response_str, CvEvaluationOutput)
+        jd_context, cv_rubric_context, brief_context, project_rubric_context = query_rag_batch([
+            (f"skills untuk {job_title}", ["job_description"]),
+            ("rubrik penilaian cv", ["cv_rubric"]),
+            ("persyaratan case study", ["case_study_brief"]),
+            ("rubrik penilaian proyek", ["project_rubric"]),
+        ])
         
-        print(f"Job {job_id}: Memulai Evaluasi Proyek...")
-        brief_context = query_rag(
-            query_text="persyaratan case study", 
-            sources=["case_study_brief"]
-        )
-        project_rubric_context = query_rag(
-            query_text="rubrik penilaian proyek", 
-            sources=["project_rubric"]
+        # Evaluasi CV dan Proyek saling independen, jadi jalankan bersamaan
+        print(f"Job {job_id}: Memulai Evaluasi CV & Proyek (paralel)...")
+        cv_eval, project_eval = await asyncio.gather(
+            evaluate_cv(cv_text, jd_context, cv_rubric_context),
+            evaluate_project(report_text, brief_context, project_rubric_context)
         )
-        project_prompt = create_project_prompt(
-            report_text, brief_context, project_rubric_context
-        )
-        project_response_str = call_gemini_with_retry(project_prompt)
-        project_eval = parse_llm_json(project_response_str, ProjectEvaluationOutput)
         
         print(f"Job {job_id}: Memulai Analisis Akhir...")
         summary_prompt = create_summary_prompt(cv_eval, project_eval)
-        summary_response_str = call_gemini_with_retry(summary_prompt)
+        summary_response_str = await asyncio.to_thread(
+            call_gemini_with_retry, summary_prompt, FinalSummaryOutput
+        )
         summary_eval = parse_llm_json(summary_response_str, FinalSummaryOutput)
         
         final_result = EvaluationResultData(
@@ -331,18 +504,9 @@ def run_real_evaluation_pipeline(
         raise e
 
 def _get_chroma_collection():
-    """Helper untuk mendapatkan koneksi collection."""
-    if collection: # 'collection' dari global scope
-        return collection
-        
-    # Jika 'collection' gagal di-load saat startup, coba lagi
+    """Helper untuk mendapatkan koneksi collection (None jika gagal)."""
     try:
-        client = chromadb.PersistentClient(path=CHROMA_DB_PATH)
-        embedding_func = SentenceTransformerEmbeddingFunction(model_name=EMBEDDING_MODEL_NAME)
-        return client.get_collection(
-            name=COLLECTION_NAME,
-            embedding_function=embedding_func # type: ignore
-        )
+        return get_collection()
     except Exception as e:
         print(f"Gagal mendapatkan Chroma collection: {e}")
         return None
@@ -368,7 +532,7 @@ def list_ground_truth_documents() -> List[Dict[str, Any]]:
     return [{"source_name": name, "chunk_count": count} for name, count in sources.items()]
 
 def ingest_document(
-    file_bytes: bytes, 
+    file_path: str, 
     file_name: str, 
     source_name: str
 ) -> Dict[str, Any]:
@@ -377,11 +541,10 @@ def ingest_document(
     content = ""
     try:
         if file_name.endswith(".pdf"):
-            reader = PdfReader(io.BytesIO(file_bytes)) # Baca dari bytes
-            for page in reader.pages:
-                content += page.extract_text() + "\n\n"
+            content = extract_pdf_text(file_path) # Baca dari file sementara
         elif file_name.endswith(".txt"):
-            content = file_bytes.decode('utf-8')
+            with open(file_path, 'r', encoding='utf-8') as f:
+                content = f.read()
         else:
             raise ValueError("Tipe file tidak didukung. Hanya .pdf atau .txt")
     except Exception as e:
@@ -389,34 +552,45 @@ def ingest_document(
         raise HTTPException(status_code=400, detail=f"Gagal mem-parsing file: {e}")
 
     # Logika splitting
-    from scripts.ingest import split_text_into_chunks, generate_document_id
+    from scripts.ingest import (
+        split_text_into_chunks, generate_document_ids,
+        get_existing_ids, delete_stale_source_chunks
+    )
     
     chunks = split_text_into_chunks(content, source_name)
     
-    all_chunks_text = []
-    all_metadatas = []
-    all_ids = []
-    
-    for chunk in chunks:
-        chunk_text = chunk['text']
-        chunk_id = generate_document_id(chunk_text)
-        all_chunks_text.append(chunk_text)
-        all_metadatas.append(chunk['metadata'])
-        all_ids.append(chunk_id)
+    # ID = hash teks; chunk duplikat di dokumen yang sama cukup disimpan sekali
+    unique_chunks = dict(zip(generate_document_ids([chunk['text'] for chunk in chunks]), chunks))
 
     # Upsert ke ChromaDB
     coll = _get_chroma_collection()
     if not coll:
         raise HTTPException(status_code=500, detail="Database Chroma tidak tersedia")
         
-    coll.upsert(
-        documents=all_chunks_text,
-        metadatas=all_metadatas,
-        ids=all_ids
-    )
+    # Hanya chunk yang belum tersimpan yang perlu di-embed
+    existing_ids = get_existing_ids(coll, list(unique_chunks))
+    new_ids = [chunk_id for chunk_id in unique_chunks if chunk_id not in existing_ids]
+    new_texts = [unique_chunks[chunk_id]['text'] for chunk_id in new_ids]
+    new_metadatas = [unique_chunks[chunk_id]['metadata'] for chunk_id in new_ids]
+
+    # Embedding dihitung sendiri per batch agar model meng-encode banyak chunk sekaligus
+    embed_fn = get_embedding_function()
+    for i in range(0, len(new_ids), EMBEDDING_BATCH_SIZE):
+        batch_texts = new_texts[i:i + EMBEDDING_BATCH_SIZE]
+        coll.upsert(
+            embeddings=embed_fn(batch_texts),
+            documents=batch_texts,
+            metadatas=new_metadatas[i:i + EMBEDDING_BATCH_SIZE],
+            ids=new_ids[i:i + EMBEDDING_BATCH_SIZE]
+        )
+    # Upload ulang sumber yang sama menggantikan versi lamanya; chunk lama baru
+    # dihapus setelah versi baru tersimpan agar sumber tidak pernah kosong
+    delete_stale_source_chunks(coll, source_name, unique_chunks.keys())
+    # Ground truth berubah, buang hasil RAG yang sudah di-cache
+    _query_rag_batch_cached.cache_clear()
     
     return {
         "message": "Dokumen berhasil di-ingest",
         "source_name": source_name,
-        "chunks_added": len(all_chunks_text)
+        "chunks_added": len(chunks)
     }
\ No newline at end of file
@@ -1,6 +1,11 @@
 import os
 import sys
+import asyncio
+import hashlib
+from typing import Optional
 from celery import Celery
+from celery.result import AsyncResult
+from kombu import Queue
 
 # Tambahkan path root proyek agar worker bisa impor 'app.services'
 project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
@@ -18,12 +23,38 @@ celery_app = Celery(
 # Impor pipeline AI 
 from app.services import run_real_evaluation_pipeline
 
+# Hasil evaluasi untuk input identik dipakai ulang selama 24 jam
+EVALUATION_CACHE_TTL_SECONDS = 24 * 60 * 60
+
+def make_evaluation_cache_key(cv_id: str, project_report_id: str, job_title: str) -> str:
+    """
+    Key cache hasil evaluasi. ID file sudah berupa hash isi file,
+    jadi key ini identik untuk CV + Laporan Proyek + job title yang sama.
+    """
+    digest = hashlib.sha256(f"{cv_id}:{project_report_id}:{job_title}".encode("utf-8")).hexdigest()
+    return f"eval:{digest}"
+
+def find_cached_evaluation(cache_key: str) -> Optional[str]:
+    """Mengembalikan ID task yang sudah sukses untuk key ini (jika hasilnya masih ada)."""
+    try:
+        task_id = celery_app.backend.client.get(cache_key) # type: ignore
+    except Exception as e:
+        print(f"Gagal membaca cache evaluasi: {e}")
+        return None
+    if not task_id:
+        return None
+    task_id = task_id.decode("utf-8") if isinstance(task_id, bytes) else task_id
+    if AsyncResult(task_id, app=celery_app).status != "SUCCESS":
+        return None
+    return task_id
+
 @celery_app.task(name="tasks.evaluate_candidate", bind=True)
 def evaluate_candidate_task(
     self,
     cv_path: str, 
     report_path: str, 
-    job_title: str
+    job_title: str,
+    cache_key: Optional[str] = None
 ):
     """
     Wrapper Celery untuk pipeline AI Anda.
@@ -33,11 +64,17 @@ def evaluate_candidate_task(
     print(f"CELERY WORKER: Menerima job {job_id}")
     print(f"Job title: {job_title}, CV path: {cv_path}, Report path: {report_path}")
     try:
-        # Panggil fungsi pipeline asli
-        final_result = run_real_evaluation_pipeline(
+        # Panggil fungsi pipeline asli (async) dari dalam task Celery yang sync
+        final_result = asyncio.run(run_real_evaluation_pipeline(
             job_id, cv_path, report_path, job_title
-        )
+        ))
         print(f"CELERY WORKER: Job {job_id} sukses.")
+        if cache_key:
+            # Simpan ID job ini agar submit ulang yang identik bisa memakai hasilnya
+            try:
+                celery_app.backend.client.setex(cache_key, EVALUATION_CACHE_TTL_SECONDS, job_id) # type: ignore
+            except Exception as e:
+                print(f"CELERY WORKER: Gagal menyimpan cache evaluasi: {e}")
         # Kembalikan hasil. Celery akan menyimpannya di backend (Redis).
         return final_result.model_dump()
     
@@ -50,4 +87,15 @@ def evaluate_candidate_task(
 # Konfigurasi opsional tapi bagus
 celery_app.conf.update(
     task_track_started=True,
+    # Hasil task harus bertahan minimal selama cache evaluasi berlaku
+    result_expires=EVALUATION_CACHE_TTL_SECONDS,
+    # Job evaluasi tidak perlu bertahan melewati restart broker,
+    # jadi pesan dan antrian dibuat transient (tanpa persistensi).
+    task_default_delivery_mode='transient',
+    task_queues=(Queue('celery', durable=False),),
+    # Task LLM berjalan lama (10-30 detik): ambil satu task per proses saja
+    # dan ack setelah selesai, agar job terbagi rata dan tidak hilang saat worker mati.
+    worker_prefetch_multiplier=1,
+    task_acks_late=True,
+    task_reject_on_worker_lost=True,
 )
\ No newline at end of file
@@ -1,11 +1,81 @@
 import streamlit as st
 import requests
+from requests.adapters import HTTPAdapter
+from requests_toolbelt.multipart.encoder import MultipartEncoder
 import time
 import os
+import json
 
 # Konfigurasi URL API
 API_BASE_URL = os.getenv("API_URL", "http://127.0.0.1:8000")
 
+# Jeda polling hasil evaluasi (detik)
+POLL_INITIAL_DELAY = 1.0
+POLL_MAX_DELAY = 8.0
+POLL_ERROR_MAX_DELAY = 30.0
+# Batas tunggu tanpa data di stream SSE (server mengirim keep-alive tiap 15 detik)
+SSE_READ_TIMEOUT = 60
+# Umur daftar dokumen di sisi klien sebelum divalidasi ulang ke server (detik)
+DOCS_CACHE_TTL = 60
+
+@st.cache_resource
+def get_http_session() -> requests.Session:
+    """Session HTTP bersama (connection pool keep-alive) untuk semua panggilan API."""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=10, pool_maxsize=10, max_retries=3)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+session = get_http_session()
+
+def render_result(placeholder, result_data):
+    """Menampilkan status mentah job dan notifikasi saat selesai/gagal."""
+    placeholder.json(result_data)
+    status = result_data.get("status")
+    if status == "completed":
+        st.success("Evaluasi Selesai!")
+        st.balloons()
+    elif status == "failed":
+        st.error(f"Evaluasi Gagal: {result_data.get('error')}")
+
+def stream_job_status(job_id, placeholder):
+    """
+    Mengikuti status job lewat Server-Sent Events (/result/{id}/stream).
+    Mengembalikan status terakhir yang diterima ("" jika stream tidak tersedia atau terputus).
+    """
+    status = ""
+    try:
+        with session.get(
+            f"{API_BASE_URL}/result/{job_id}/stream",
+            stream=True,
+            timeout=(10, SSE_READ_TIMEOUT)
+        ) as stream_res:
+            if stream_res.status_code == 404:
+                return status
+            stream_res.raise_for_status()
+            event = "message"
+            for line in stream_res.iter_lines(decode_unicode=True):
+                if not line:
+                    event = "message" # baris kosong = akhir satu event
+                    continue
+                if line.startswith("event:"):
+                    event = line[len("event:"):].strip()
+                    continue
+                if not line.startswith("data:"):
+                    continue # komentar keep-alive
+                if event != "message":
+                    # Event 'error' / 'timeout': stream ditutup server, lanjut dengan polling
+                    break
+                result_data = json.loads(line[len("data:"):])
+                status = result_data.get("status") or status
+                render_result(placeholder, result_data)
+                if status in ["completed", "failed"]:
+                    break
+    except Exception as e:
+        st.warning(f"Stream status terputus, beralih ke polling: {e}")
+    return status
+
 st.set_page_config(layout="wide")
 st.title("🤖 Dashboard AI Screening Karyawan")
 
@@ -24,11 +94,18 @@ if st.button("Mulai Evaluasi", use_container_width=True):
     if cv_file and report_file and job_title:
         with st.spinner("1/4 - Mengupload file..."):
             try:
-                files = {
+                # Multipart di-stream per chunk dari file-like UploadedFile,
+                # tanpa membangun seluruh body upload di memori
+                encoder = MultipartEncoder(fields={
                     'cv': (cv_file.name, cv_file, 'application/pdf'),
                     'project_report': (report_file.name, report_file, 'application/pdf')
-                }
-                upload_res = requests.post(f"{API_BASE_URL}/upload", files=files, timeout=10)
+                })
+                upload_res = session.post(
+                    f"{API_BASE_URL}/upload",
+                    data=encoder,
+                    headers={'Content-Type': encoder.content_type},
+                    timeout=30
+                )
                 upload_res.raise_for_status()
                 upload_data = upload_res.json()
                 st.session_state['cv_id'] = upload_data['cv_id']
@@ -45,7 +122,7 @@ if st.button("Mulai Evaluasi", use_container_width=True):
                     'cv_id': st.session_state['cv_id'],
                     'project_report_id': st.session_state['project_report_id']
                 }
-                eval_res = requests.post(f"{API_BASE_URL}/evaluate", json=eval_payload, timeout=10)
+                eval_res = session.post(f"{API_BASE_URL}/evaluate", json=eval_payload, timeout=10)
                 eval_res.raise_for_status()
                 eval_data = eval_res.json()
                 st.session_state['job_id'] = eval_data['id']
@@ -60,26 +137,27 @@ if st.button("Mulai Evaluasi", use_container_width=True):
         result_placeholder = st.empty()
         
         with st.spinner(f"3/4 - Menunggu hasil untuk Job ID: {job_id}... (Ini bisa memakan waktu 1-2 menit)"):
-            status = ""
+            # Utamakan push via SSE; polling di bawah hanya jalan jika stream gagal/tidak ada
+            status = stream_job_status(job_id, result_placeholder)
+            delay = POLL_INITIAL_DELAY
             while status not in ["completed", "failed"]:
                 try:
-                    time.sleep(5) # Jeda 5 detik
-                    result_res = requests.get(f"{API_BASE_URL}/result/{job_id}", timeout=10)
+                    time.sleep(delay)
+                    result_res = session.get(f"{API_BASE_URL}/result/{job_id}", timeout=10)
                     result_data = result_res.json()
-                    status = result_data.get("status")
+                    previous_status, status = status, result_data.get("status")
                     
-                    # Tampilkan status mentah
-                    result_placeholder.json(result_data)
+                    # Backoff bertahap; reset saat status berubah (misal: queued -> processing)
+                    if status != previous_status:
+                        delay = POLL_INITIAL_DELAY
+                    else:
+                        delay = min(delay * 1.5, POLL_MAX_DELAY)
                     
-                    if status == "completed":
-                        st.success("Evaluasi Selesai!")
-                        st.balloons()
-                    elif status == "failed":
-                        st.error(f"Evaluasi Gagal: {result_data.get('error')}")
+                    render_result(result_placeholder, result_data)
                 
                 except Exception as e:
                     st.warning(f"Gagal mengambil status: {e}")
-                    time.sleep(10) # Jika error, tunggu lebih lama
+                    delay = min(delay * 2, POLL_ERROR_MAX_DELAY) # Jika error, tunggu lebih lama
 
     else:
         st.warning("Harap upload CV, Laporan Proyek, dan isi Judul Pekerjaan.")
@@ -99,16 +177,19 @@ with col3:
         if doc_file and doc_source_name:
             with st.spinner(f"Meng-ingest {doc_source_name}..."):
                 try:
-                    doc_files = {'file': (doc_file.name, doc_file, doc_file.type)}
-                    doc_data = {'source_name': doc_source_name}
-                    doc_res = requests.post(
+                    doc_encoder = MultipartEncoder(fields={
+                        'file': (doc_file.name, doc_file, doc_file.type),
+                        'source_name': doc_source_name
+                    })
+                    doc_res = session.post(
                         f"{API_BASE_URL}/documents", 
-                        files=doc_files, 
-                        data=doc_data,
+                        data=doc_encoder,
+                        headers={'Content-Type': doc_encoder.content_type},
                         timeout=30
                     )
                     doc_res.raise_for_status()
                     st.success(f"Berhasil: {doc_res.json().get('message')}")
+                    st.session_state.pop('docs_fetched_at', None) # Paksa ambil ulang daftar dokumen
                     st.rerun() # Refresh halaman untuk update daftar
                 except Exception as e:
                     st.error(f"Gagal ingest: {e}")
@@ -117,18 +198,35 @@ with col3:
 
 with col4:
     st.subheader("Dokumen di Vector DB")
-    if st.button("Refresh Daftar Dokumen"):
-        st.cache_data.clear()
+    # Tombol melewati TTL; daftar divalidasi ulang via conditional GET (ETag)
+    refresh_docs = st.button("Refresh Daftar Dokumen")
         
-    @st.cache_data(ttl=60) # Cache selama 60 detik
-    def get_doc_list():
+    def get_doc_list(force=False):
+        # Rerun Streamlit terjadi di setiap interaksi widget; dalam DOCS_CACHE_TTL
+        # pakai daftar yang tersimpan tanpa memanggil server sama sekali
+        fetched_at = st.session_state.get('docs_fetched_at')
+        if not force and fetched_at is not None and time.monotonic() - fetched_at < DOCS_CACHE_TTL:
+            return st.session_state['docs_cache']
+
+        etag = st.session_state.get('docs_etag')
         try:
-            res = requests.get(f"{API_BASE_URL}/documents", timeout=10)
+            res = session.get(
+                f"{API_BASE_URL}/documents",
+                headers={"If-None-Match": etag} if etag else {},
+                timeout=10
+            )
+            if res.status_code == 304:
+                # Tidak berubah di server, pakai daftar yang sudah disimpan
+                st.session_state['docs_fetched_at'] = time.monotonic()
+                return st.session_state.get('docs_cache', [])
             res.raise_for_status()
-            return res.json()
+            st.session_state['docs_cache'] = res.json()
+            st.session_state['docs_etag'] = res.headers.get("ETag")
+            st.session_state['docs_fetched_at'] = time.monotonic()
+            return st.session_state['docs_cache']
         except Exception as e:
             st.error(f"Gagal mengambil daftar dokumen: {e}")
-            return []
+            return st.session_state.get('docs_cache', [])
             
-    docs = get_doc_list()
+    docs = get_doc_list(force=refresh_docs)
     st.dataframe(docs, use_container_width=True)
\ No newline at end of file
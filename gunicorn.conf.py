@@ -0,0 +1,18 @@
+"""
+Konfigurasi Gunicorn untuk menjalankan API di production.
+Jalankan dengan: gunicorn app.main:app -c gunicorn.conf.py
+"""
+
+import multiprocessing
+import os
+
+bind = os.getenv("API_BIND", "0.0.0.0:8000")
+
+# Worker Uvicorn dari paket uvicorn-worker (uvloop + httptools dari uvicorn[standard]);
+# uvicorn.workers.UvicornWorker sudah deprecated
+worker_class = "uvicorn_worker.UvicornWorker"
+workers = int(os.getenv("WEB_CONCURRENCY", 2 * multiprocessing.cpu_count() + 1))
+
+# Access log dimatikan di production, cukup log warning ke atas
+accesslog = None
+loglevel = os.getenv("LOG_LEVEL", "warning")
@@ -1,9 +1,16 @@
 import os
 import sys
 import hashlib
+import json
+import threading
+import functools
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from queue import Empty, Full, Queue
 import chromadb
-from chromadb.utils import embedding_functions
-from pypdf import PdfReader
+import numpy as np
+from chromadb import Documents, EmbeddingFunction, Embeddings
+import pymupdf
 from dotenv import load_dotenv
 
 # --- Konfigurasi ---
@@ -14,98 +21,455 @@ sys.path.insert(0, project_root)
 # --- Konstanta ---
 GROUND_TRUTH_DIR = os.path.join(project_root, "docs_ground_truth")
 CHROMA_DB_PATH = os.path.join(project_root, "chroma_db")
+# Jika CHROMA_HOST di-set, gunakan server Chroma (HttpClient) alih-alih file lokal
+CHROMA_HOST = os.getenv("CHROMA_HOST")
+# Manifest {nama file: [mtime_ns, size]} dari file yang sudah sukses di-ingest;
+# disimpan di dalam chroma_db/ agar ikut ter-reset saat database dihapus.
+# Hanya dipakai untuk DB lokal: isi server Chroma (CHROMA_HOST) tidak tercermin di file lokal.
+INGEST_MANIFEST_PATH = os.path.join(CHROMA_DB_PATH, "ingest_manifest.json")
+CHROMA_PORT = int(os.getenv("CHROMA_PORT", "8001"))
 COLLECTION_NAME = "screening_collection"
 EMBEDDING_MODEL_NAME = "all-MiniLM-L6-v2" 
+EMBEDDING_DEVICE = os.getenv("EMBEDDING_DEVICE")  # misal: "cpu" / "cuda"; kosong = otomatis
+# PDF dengan halaman lebih dari ini dipecah per blok ke beberapa proses
+PDF_PAGE_BLOCK_SIZE = 5
+# Jumlah chunk per panggilan upsert ke ChromaDB
+UPSERT_BATCH_SIZE = 200
+# Jumlah batch chunk yang boleh menunggu di antrean parsing -> embedding
+INGEST_QUEUE_SIZE = 4
+# Interval thread parser mengecek sinyal berhenti saat antrean penuh
+INGEST_QUEUE_POLL_SECONDS = 0.5
+# Ukuran batch untuk SentenceTransformer.encode
+EMBEDDING_BATCH_SIZE = 64
+# Parameter HNSW untuk collection baru: construction_ef rendah agar bulk insert cepat,
+# search_ef lebih tinggi agar recall saat kueri tetap terjaga
+HNSW_METADATA = {
+    "hnsw:space": "cosine",
+    "hnsw:construction_ef": 64,
+    "hnsw:M": 16,
+    "hnsw:search_ef": 100,
+    "hnsw:batch_size": 1000,
+    "hnsw:sync_threshold": 10000,
+}
 
 # --- Setup Klien & Model ---
 
+class LocalEmbeddingFunction(EmbeddingFunction[Documents]):
+    """
+    Embedding function ChromaDB berbasis SentenceTransformer lokal.
+    Model dimuat sekali di GPU (fp16) jika tersedia, atau CPU (fp32),
+    dan meng-encode input dalam batch besar dengan embedding ter-normalisasi.
+    """
+
+    def __init__(self, model_name=EMBEDDING_MODEL_NAME, batch_size=EMBEDDING_BATCH_SIZE):
+        import torch
+        from sentence_transformers import SentenceTransformer
+
+        self.device = EMBEDDING_DEVICE or ("cuda" if torch.cuda.is_available() else "cpu")
+        self._model = SentenceTransformer(model_name, device=self.device)
+        if self.device.startswith("cuda"):
+            self._model.half()
+        self._batch_size = batch_size
+
+    def encode(self, texts, show_progress_bar=False):
+        """Encode teks menjadi matriks ndarray float32 (satu baris per teks)."""
+        return self._model.encode(
+            list(texts),
+            batch_size=self._batch_size,
+            convert_to_numpy=True,
+            normalize_embeddings=True,
+            show_progress_bar=show_progress_bar
+        ).astype(np.float32, copy=False)
+
+    def __call__(self, input: Documents) -> Embeddings:
+        return self.encode(input).tolist()
+
+@functools.cache
 def get_embedding_function():
     """
-    Membuat embedding function untuk ChromaDB menggunakan SentenceTransformer lokal.
+    Embedding function untuk ChromaDB (lokal, tanpa API), dibuat sekali per proses.
     Model akan diunduh secara otomatis oleh library saat pertama kali dijalankan.
     """
-    print(f"Menggunakan model embedding lokal: {EMBEDDING_MODEL_NAME}")
-    return embedding_functions.SentenceTransformerEmbeddingFunction(
-        model_name=EMBEDDING_MODEL_NAME
-    )
+    embedding_func = LocalEmbeddingFunction()
+    print(f"Menggunakan model embedding lokal: {EMBEDDING_MODEL_NAME} ({embedding_func.device})")
+    return embedding_func
 
 def init_chroma_client():
     """
-    Inisialisasi klien ChromaDB yang persistent (disimpan ke disk).
+    Inisialisasi klien ChromaDB.
+    Default-nya persistent (disimpan ke disk); jika CHROMA_HOST di-set,
+    terhubung ke server Chroma via HTTP.
     """
+    if CHROMA_HOST:
+        print(f"Menghubungkan ke server ChromaDB di: {CHROMA_HOST}:{CHROMA_PORT}")
+        return chromadb.HttpClient(host=CHROMA_HOST, port=CHROMA_PORT)
     print(f"Inisialisasi ChromaDB di: {CHROMA_DB_PATH}")
-    client = chromadb.PersistentClient(path=CHROMA_DB_PATH)
-    return client
+    return chromadb.PersistentClient(path=CHROMA_DB_PATH)
+
+def get_or_create_collection(client, embedding_func):
+    """
+    Mengambil collection yang sudah ada, atau membuatnya dengan parameter HNSW
+    untuk bulk-ingest. Parameter HNSW hanya berlaku saat pembuatan; collection
+    lama dibiarkan apa adanya (Chroma tidak mengizinkan mengubah distance/space).
+    """
+    existing_names = [getattr(c, "name", c) for c in client.list_collections()]
+    if COLLECTION_NAME in existing_names:
+        return client.get_collection(
+            name=COLLECTION_NAME,
+            embedding_function=embedding_func  # type: ignore
+        )
+    print(f"Membuat collection baru dengan parameter HNSW: {HNSW_METADATA}")
+    return client.create_collection(
+        name=COLLECTION_NAME,
+        embedding_function=embedding_func,  # type: ignore
+        metadata=HNSW_METADATA
+    )
 
 # --- Logika Pemuatan & Pemecahan Dokumen ---
 
-def load_documents_from_directory(directory_path):
-    print(f"Memuat dokumen dari: {directory_path}")
-    documents = []
-    
-    for filename in os.listdir(directory_path):
-        filepath = os.path.join(directory_path, filename)
-        content = ""
-        source_name = os.path.splitext(filename)[0] 
+def _extract_pages(filepath, start, end):
+    """Ekstrak teks halaman [start, end) dari satu PDF (top-level agar bisa di-pickle)."""
+    with pymupdf.open(filepath) as doc:
+        return [doc[i].get_text() for i in range(start, end)]
+
+def _extract_one(filepath):
+    """
+    Memuat satu file (.txt atau .pdf) di proses worker.
+    Mengembalikan list teks per halaman (.txt = satu "halaman"), atau None jika gagal / kosong.
+    """
+    filename = os.path.basename(filepath)
+    pages = []
+
+    try:
+        if filename.endswith(".txt"):
+            with open(filepath, 'r', encoding='utf-8') as f:
+                pages = [f.read()]
+            print(f"  - Sukses memuat {filename}")
+
+        elif filename.endswith(".pdf"):
+            # Satu kali buka file: hitung halaman dan ekstrak teks sekaligus
+            with pymupdf.open(filepath) as doc:
+                pages = [page.get_text() for page in doc]
+            print(f"  - Sukses memuat {filename} ({len(pages)} halaman)")
 
+    except Exception as e:
+        print(f"  - Gagal memuat {filename}: {e}")
+        return None
+
+    return pages if any(pages) else None
+
+def _count_pdf_pages(filepath):
+    """Jumlah halaman PDF (0 jika tidak bisa dibaca; error dilaporkan oleh _extract_one)."""
+    try:
+        with pymupdf.open(filepath) as doc:
+            return doc.page_count
+    except Exception:
+        return 0
+
+def file_fingerprint(filepath):
+    """Sidik file untuk manifest: [mtime_ns, size] (murah, tanpa membaca isi file)."""
+    stat = os.stat(filepath)
+    return [stat.st_mtime_ns, stat.st_size]
+
+def load_manifest(path=None):
+    """Memuat manifest ingest; manifest yang tidak ada / rusak dianggap kosong."""
+    path = path or INGEST_MANIFEST_PATH
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def save_manifest(manifest, path=None):
+    """Menulis manifest secara atomik (file sementara lalu os.replace)."""
+    path = path or INGEST_MANIFEST_PATH
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, path)
+
+def iter_paragraphs(pages):
+    """Memecah teks per halaman menjadi paragraf secara lazy (tanpa menggabung seluruh dokumen)."""
+    for page_text in pages:
+        for paragraph in page_text.split("\n\n"):
+            paragraph = paragraph.strip()
+            if paragraph:
+                yield paragraph
+
+def _iter_pdf_block_pages(executor, filepath, num_pages, window):
+    """
+    Mengekstrak PDF besar per blok PDF_PAGE_BLOCK_SIZE halaman di executor dengan
+    maksimal `window` blok berjalan sekaligus, dan mengembalikan iterator halaman
+    sesuai urutan. Blok pertama langsung dikirim (sebelum iterator dipakai); hasil
+    setiap blok dilepas setelah dikonsumsi, sehingga memori per dokumen dibatasi
+    oleh window, bukan oleh jumlah halaman.
+    """
+    filename = os.path.basename(filepath)
+    starts = iter(range(0, num_pages, PDF_PAGE_BLOCK_SIZE))
+    pending = deque()
+
+    def fill():
+        while len(pending) < window:
+            start = next(starts, None)
+            if start is None:
+                return
+            end = min(start + PDF_PAGE_BLOCK_SIZE, num_pages)
+            pending.append(executor.submit(_extract_pages, filepath, start, end))
+
+    def pages():
+        num_blocks = 0
         try:
-            if filename.endswith(".txt"):
-                with open(filepath, 'r', encoding='utf-8') as f:
-                    content = f.read()
-                print(f"  - Sukses memuat {filename}")
-                    
-            elif filename.endswith(".pdf"):
-                reader = PdfReader(filepath)
-                for page in reader.pages:
-                    content += page.extract_text() + "\n\n" 
-                print(f"  - Sukses memuat {filename} ({len(reader.pages)} halaman)")
-                
-            if content:
-                documents.append({"source": source_name, "content": content})
-                
+            while pending:
+                block = pending.popleft().result()
+                fill()
+                num_blocks += 1
+                yield from block
+                del block
         except Exception as e:
             print(f"  - Gagal memuat {filename}: {e}")
-            
-    return documents
+            raise
+        finally:
+            for future in pending:
+                future.cancel()
+        print(f"  - Sukses memuat {filename} ({num_pages} halaman, {num_blocks} blok)")
 
-def split_text_into_chunks(text, source_name, chunk_size=1000, chunk_overlap=100):
-    chunks = []
-    paragraphs = [p.strip() for p in text.split("\n\n") if p.strip()]
-    
-    current_chunk = ""
+    fill()
+    return pages()
+
+def load_documents_from_directory(directory_path, manifest=None):
+    """
+    Generator yang menghasilkan satu dict per dokumen:
+    {"file", "source", "fingerprint", "paragraphs"}, di mana paragraphs adalah
+    iterator paragraf yang lazy. File yang sidiknya sama dengan di manifest dilewati.
+    Ekstraksi berjalan paralel di ProcessPoolExecutor (lepas dari GIL); PDF besar
+    dipecah per blok PDF_PAGE_BLOCK_SIZE halaman yang diekstrak dan dikonsumsi
+    bertahap (lihat _iter_pdf_block_pages). Jumlah file yang diproses di depan dan
+    jumlah blok per PDF yang berjalan sekaligus dibatasi, sehingga memori tidak
+    bergantung pada panjang dokumen. Jika PDF besar gagal di tengah, iterator
+    paragrafnya melempar exception.
+    """
+    print(f"Memuat dokumen dari: {directory_path}")
+    with os.scandir(directory_path) as it:
+        filepaths = [entry.path for entry in it if entry.is_file()]
+
+    fingerprints = {filepath: file_fingerprint(filepath) for filepath in filepaths}
+    if manifest:
+        changed = [fp for fp in filepaths if manifest.get(os.path.basename(fp)) != fingerprints[fp]]
+        skipped = len(filepaths) - len(changed)
+        if skipped:
+            print(f"  - Melewati {skipped} file yang tidak berubah sejak ingest terakhir")
+        filepaths = changed
+
+    if not filepaths:
+        return
+
+    # Jumlah halaman menentukan jumlah task (blok per PDF besar, satu per file lainnya),
+    # agar pool tidak membuat proses lebih banyak dari task yang ada
+    page_counts = {
+        filepath: _count_pdf_pages(filepath) if filepath.endswith(".pdf") else 0
+        for filepath in filepaths
+    }
+    num_tasks = sum(
+        -(-num_pages // PDF_PAGE_BLOCK_SIZE) if num_pages > PDF_PAGE_BLOCK_SIZE else 1
+        for num_pages in page_counts.values()
+    )
+    max_workers = min(os.cpu_count() or 1, num_tasks)
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        def submit(filepath):
+            num_pages = page_counts[filepath]
+            if num_pages > PDF_PAGE_BLOCK_SIZE:
+                return (filepath, _iter_pdf_block_pages(executor, filepath, num_pages, max_workers))
+            return (filepath, executor.submit(_extract_one, filepath))
+
+        remaining = iter(filepaths)
+        pending = deque()
+        while True:
+            while len(pending) < 2 * max_workers:
+                filepath = next(remaining, None)
+                if filepath is None:
+                    break
+                pending.append(submit(filepath))
+            if not pending:
+                break
+
+            filepath, extraction = pending.popleft()
+            filename = os.path.basename(filepath)
+            source_name = os.path.splitext(filename)[0]
+            # File kecil: satu future berisi semua halaman; PDF besar: iterator halaman lazy
+            pages = extraction.result() if isinstance(extraction, Future) else extraction
+            if pages:
+                yield {
+                    "file": filename,
+                    "source": source_name,
+                    "fingerprint": fingerprints[filepath],
+                    "paragraphs": iter_paragraphs(pages),
+                }
+
+def iter_chunks(paragraphs, source_name, chunk_size=1000):
+    """
+    Menyusun paragraf (iterable apa pun, boleh lazy) menjadi chunk berukuran
+    maksimal chunk_size karakter. Menghasilkan chunk satu per satu.
+    """
+    # Paragraf ditampung di list lalu di-join sekali per chunk (bukan string +=);
+    # buffer_len menghitung panjang chunk termasuk separator "\n\n" per paragraf.
+    buffer = []
+    buffer_len = 0
     for paragraph in paragraphs:
-        if len(current_chunk) + len(paragraph) + 2 <= chunk_size:
-            current_chunk += paragraph + "\n\n"
+        if buffer_len + len(paragraph) + 2 <= chunk_size:
+            buffer.append(paragraph)
+            buffer_len += len(paragraph) + 2
         else:
-            if current_chunk:
-                chunks.append({
-                    "text": current_chunk.strip(),
+            if buffer:
+                yield {
+                    "text": "\n\n".join(buffer),
                     "metadata": {"source": source_name}
-                })
-            current_chunk = paragraph + "\n\n"
+                }
+            buffer = [paragraph]
+            buffer_len = len(paragraph) + 2
             
-    if current_chunk:
-        chunks.append({
-            "text": current_chunk.strip(),
+    if buffer:
+        yield {
+            "text": "\n\n".join(buffer),
             "metadata": {"source": source_name}
-        })
-        
+        }
+
+def split_text_into_chunks(text, source_name, chunk_size=1000, chunk_overlap=100):
+    chunks = list(iter_chunks(iter_paragraphs([text]), source_name, chunk_size))
     print(f"    - Memecah '{source_name}' menjadi {len(chunks)} chunk")
     return chunks
 
-def generate_document_id(text_chunk):
-    return hashlib.md5(text_chunk.encode('utf-8')).hexdigest()
+def generate_document_ids(text_chunks):
+    """ID chunk untuk satu batch teks; satu-satunya tempat ID chunk dihitung."""
+    # BLAKE2b 128-bit: lebih cepat dari MD5, panjang ID tetap 32 karakter hex
+    blake2b = hashlib.blake2b
+    encoded = [text_chunk.encode('utf-8') for text_chunk in text_chunks]
+    return [blake2b(data, digest_size=16).hexdigest() for data in encoded]
+
+def get_existing_ids(collection, ids):
+    """Mengembalikan subset ID yang sudah tersimpan di collection (dicek per batch)."""
+    existing = set()
+    for i in range(0, len(ids), UPSERT_BATCH_SIZE):
+        existing.update(collection.get(ids=ids[i:i + UPSERT_BATCH_SIZE], include=[])["ids"])
+    return existing
+
+def delete_stale_source_chunks(collection, source_name, keep_ids):
+    """
+    Menghapus chunk milik satu sumber yang tidak ada di keep_ids (ID hasil ingest
+    terbaru), misal dari format ID lama atau hasil ekstraksi PDF yang berubah.
+    Dipanggil setelah versi baru tersimpan, agar sumber tidak pernah kosong di
+    tengah ingest (API/worker bisa membaca collection yang sama).
+    Mengembalikan jumlah chunk yang dihapus.
+    """
+    stored_ids = collection.get(where={"source": source_name}, include=[])["ids"]
+    stale_ids = [chunk_id for chunk_id in stored_ids if chunk_id not in keep_ids]
+    for i in range(0, len(stale_ids), UPSERT_BATCH_SIZE):
+        collection.delete(ids=stale_ids[i:i + UPSERT_BATCH_SIZE])
+    return len(stale_ids)
+
+def upsert_chunk_batch(collection, embedding_func, chunks, seen_ids, source_ids):
+    """
+    Meng-embed dan meng-upsert satu batch chunk. Chunk duplikat (ID = hash teks,
+    termasuk yang sudah muncul di batch sebelumnya via seen_ids) dan yang sudah
+    ada di collection dilewati, agar embedding hanya dihitung untuk chunk baru.
+    Semua ID per sumber dicatat di source_ids {source: set(ID)} untuk
+    delete_stale_source_chunks. Mengembalikan jumlah chunk yang ditambahkan.
+    """
+    new_chunks = {}
+    for chunk_id, chunk in zip(generate_document_ids([c['text'] for c in chunks]), chunks):
+        source_ids.setdefault(chunk['metadata']['source'], set()).add(chunk_id)
+        if chunk_id not in seen_ids and chunk_id not in new_chunks:
+            new_chunks[chunk_id] = chunk
+    seen_ids.update(new_chunks)
+
+    existing_ids = get_existing_ids(collection, list(new_chunks))
+    ids = [chunk_id for chunk_id in new_chunks if chunk_id not in existing_ids]
+    if not ids:
+        return 0
+
+    texts = [new_chunks[chunk_id]['text'] for chunk_id in ids]
+    collection.upsert(
+        # Kirim ndarray float32 langsung (tanpa .tolist() ke float Python)
+        embeddings=embedding_func.encode(texts),
+        documents=texts,
+        metadatas=[new_chunks[chunk_id]['metadata'] for chunk_id in ids],
+        ids=ids
+    )
+    return len(ids)
+
+# Penanda akhir antrean batch dari thread parser
+_BATCH_SENTINEL = object()
+
+def _put_until_stopped(batch_queue, item, stop_event):
+    """Memasukkan item ke antrean; False jika stop_event di-set selama antrean penuh."""
+    while not stop_event.is_set():
+        try:
+            batch_queue.put(item, timeout=INGEST_QUEUE_POLL_SECONDS)
+            return True
+        except Full:
+            continue
+    return False
+
+def produce_chunk_batches(batch_queue, manifest, processed, failed_sources, stop_event):
+    """
+    Tahap parsing pipeline (berjalan di thread terpisah): memuat dokumen, memecahnya
+    menjadi chunk, lalu memasukkan (chunks, files) per UPSERT_BATCH_SIZE ke antrean.
+    File yang dimuat dicatat di processed {nama file: fingerprint}; dokumen yang gagal
+    di tengah ekstraksi dikeluarkan lagi dari processed dan dicatat di failed_sources.
+    Berhenti lebih awal jika stop_event di-set (konsumen berhenti, misal Ctrl+C).
+    Selalu diakhiri _BATCH_SENTINEL, juga saat terjadi error.
+    Mengembalikan jumlah chunk yang dihasilkan.
+    """
+    total_chunks = 0
+    buffer = []
+    buffer_files = set()
+    documents = load_documents_from_directory(GROUND_TRUTH_DIR, manifest)
+    try:
+        for doc in documents:
+            processed[doc['file']] = doc['fingerprint']
+            doc_chunks = 0
+            try:
+                for chunk in iter_chunks(doc['paragraphs'], doc['source']):
+                    buffer.append(chunk)
+                    buffer_files.add(doc['file'])
+                    doc_chunks += 1
+                    if len(buffer) >= UPSERT_BATCH_SIZE:
+                        if not _put_until_stopped(batch_queue, (buffer, buffer_files), stop_event):
+                            return total_chunks
+                        buffer, buffer_files = [], set()
+            except Exception:
+                # Blok PDF gagal di tengah dokumen: file diulang di run berikutnya dan
+                # chunk lama sumber ini tidak dihapus (versi baru belum lengkap)
+                processed.pop(doc['file'], None)
+                failed_sources.add(doc['source'])
+                total_chunks += doc_chunks
+                continue
+            total_chunks += doc_chunks
+            print(f"    - Memecah '{doc['source']}' menjadi {doc_chunks} chunk")
+        if buffer:
+            _put_until_stopped(batch_queue, (buffer, buffer_files), stop_event)
+    finally:
+        # Tutup generator (dan process pool-nya) sebelum mengirim penanda akhir
+        documents.close()
+        _put_until_stopped(batch_queue, _BATCH_SENTINEL, stop_event)
+    return total_chunks
 
 # --- Fungsi Utama (Orchestrator) ---
 
 def main():
     """
-    Fungsi utama untuk menjalankan pipeline ingesti:
+    Fungsi utama untuk menjalankan pipeline ingesti (streaming):
     1. Inisialisasi ChromaDB & Embedding Function (lokal)
     2. Dapatkan atau buat 'collection'
-    3. Muat dokumen dari disk
+    3. Muat dokumen dari disk satu per satu (paragraf lazy), lewati file yang tidak berubah
     4. Pecah dokumen menjadi chunks
-    5. Tambahkan chunks ke ChromaDB
+    5. Embed & tambahkan chunks ke ChromaDB per batch begitu batch penuh
+    6. Hapus chunk lama yang tidak lagi dihasilkan oleh sumber yang di-ingest ulang
+    7. Catat file yang sukses di manifest (hanya untuk DB lokal)
+    Langkah 3-4 berjalan di thread parser dan langkah 5 di thread utama, dihubungkan
+    antrean terbatas, sehingga parsing dokumen berikutnya tumpang tindih dengan embedding.
+    Memori dibatasi oleh ukuran batch, antrean, dan jumlah blok PDF yang diekstrak
+    sekaligus, bukan oleh panjang dokumen.
     """
     print("--- Memulai Proses Ingesti RAG (Mode Stabil/Lokal) ---")
     
@@ -114,50 +478,82 @@ def main():
     embedding_func = get_embedding_function()
     
     # Dapatkan atau Buat Collection
-    collection = chroma_client.get_or_create_collection(
-        name=COLLECTION_NAME,
-        embedding_function=embedding_func  # type: ignore
-    )
+    # (embedding function tetap dipasang untuk meng-embed teks kueri saat RAG)
+    collection = get_or_create_collection(chroma_client, embedding_func)
     print(f"Collection '{COLLECTION_NAME}' siap digunakan.")
 
-    raw_documents = load_documents_from_directory(GROUND_TRUTH_DIR)
-    
-    # Siapkan data untuk ChromaDB
-    all_chunks_text = []
-    all_metadatas = []
-    all_ids = []
-    
-    print("\nMemecah dokumen menjadi chunks...")
-    for doc in raw_documents:
-        chunks = split_text_into_chunks(doc['content'], doc['source'])
-        
-        for chunk in chunks:
-            chunk_text = chunk['text']
-            chunk_id = generate_document_id(chunk_text)
-            
-            all_chunks_text.append(chunk_text)
-            all_metadatas.append(chunk['metadata'])
-            all_ids.append(chunk_id)
+    # Mode server (CHROMA_HOST): tanpa manifest, semua file di-ingest ulang
+    use_manifest = not CHROMA_HOST
+    manifest = load_manifest() if use_manifest else {}
+    seen_ids = set()
+    source_ids = {}
+    failed_files = set()
+    failed_sources = set()
+    processed = {}
+    stats = {"added": 0, "removed": 0, "batches": 0, "failed_batches": 0}
+    batch_queue = Queue(maxsize=INGEST_QUEUE_SIZE)
+    stop_event = threading.Event()
 
-    if not all_chunks_text:
-        print("Tidak ada dokumen yang ditemukan untuk di-ingest. Selesai.")
+    print(f"\nMemecah, meng-embed, dan menambahkan chunk ke ChromaDB per {UPSERT_BATCH_SIZE}...")
+    # Embedding & upsert di thread utama, parsing di thread parser
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        producer = executor.submit(produce_chunk_batches, batch_queue, manifest, processed, failed_sources, stop_event)
+        try:
+            while True:
+                item = batch_queue.get()
+                if item is _BATCH_SENTINEL:
+                    break
+                chunks, files = item
+                stats["batches"] += 1
+                try:
+                    added = upsert_chunk_batch(collection, embedding_func, chunks, seen_ids, source_ids)
+                    stats["added"] += added
+                    print(f"  - Batch {stats['batches']} selesai ({len(chunks)} chunk, {added} baru)")
+                except Exception as e:
+                    stats["failed_batches"] += 1
+                    failed_files.update(files)
+                    failed_sources.update(c['metadata']['source'] for c in chunks)
+                    print(f"  - Error saat menambahkan batch {stats['batches']} ke ChromaDB: {e}")
+        finally:
+            # Jika konsumen berhenti lebih awal (misal Ctrl+C), hentikan parser dan
+            # kosongkan antrean agar thread parser tidak macet di put() dan `with` bisa selesai
+            stop_event.set()
+            while True:
+                try:
+                    batch_queue.get_nowait()
+                except Empty:
+                    break
+        # Error di thread parser dilempar ulang di sini
+        stats["chunks"] = producer.result()
+
+    # Versi baru setiap sumber sudah tersimpan; baru sekarang buang chunk lamanya.
+    # Sumber dengan batch gagal dilewati agar versi lamanya tetap utuh.
+    for source_name, keep_ids in source_ids.items():
+        if source_name not in failed_sources:
+            stats["removed"] += delete_stale_source_chunks(collection, source_name, keep_ids)
+
+    # Hanya file yang semua batch-nya sukses dicatat, sisanya diulang di run berikutnya
+    if use_manifest and processed:
+        for filename, fingerprint in processed.items():
+            if filename not in failed_files:
+                manifest[filename] = fingerprint
+        save_manifest(manifest)
+
+    if not stats["chunks"]:
+        print("Tidak ada dokumen baru atau berubah untuk di-ingest. Selesai.")
         return
 
-    # Tambahkan Chunks ke ChromaDB
-    print(f"\nMenambahkan {len(all_chunks_text)} chunk ke ChromaDB (mungkin perlu mengunduh model)...")
-    try:
-        collection.upsert(
-            documents=all_chunks_text,
-            metadatas=all_metadatas,
-            ids=all_ids
-        )
-        print("--- Proses Ingesti Selesai Sukses ---")
-        print(f"Total dokumen di collection: {collection.count()}")
-        
-    except Exception as e:
-        print(f"Error saat menambahkan dokumen ke ChromaDB: {e}")
-        print("\n*** GAGAL. Kemungkinan karena koneksi internet terblokir saat mengunduh model.")
+    print(f"{stats['chunks']} chunk diproses, {len(seen_ids)} unik, {stats['added']} baru ditambahkan, {stats['removed']} chunk lama dihapus.")
+    if stats["failed_batches"]:
+        print(f"\n*** GAGAL pada {stats['failed_batches']} batch. Kemungkinan karena koneksi internet terblokir saat mengunduh model.")
         print("*** COBA LAGI menggunakan koneksi internet lain (misal: tethering HP).")
+        return
+    if failed_sources:
+        print(f"\n*** GAGAL memuat sebagian dokumen: {', '.join(sorted(failed_sources))}. Jalankan ulang ingest setelah file diperbaiki.")
+        return
+
+    print("--- Proses Ingesti Selesai Sukses ---")
+    print(f"Total dokumen di collection: {collection.count()}")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()